@@ -1,16 +1,21 @@
 import serial
 import matplotlib.pyplot as plt
-import math
+import numpy as np
+from mpl_toolkits.mplot3d import proj3d
 import time
 import datetime
 import argparse
-import csv
+import io
 import os
+import threading
 
 
 # SWITCHES BETWEEN ACM0 and ACM1
 ARDUINO_COM_PORT = "/dev/ttyACM1"
 BAUD_RATE = 115200 # Must match the rate in the Arduino code
+REDRAW_INTERVAL = 0.1 # Minimum seconds between live plot refreshes
+ARDUINO_READY_TIMEOUT = 10 # Max seconds to wait for the first data after resetting the Arduino
+NUMBA_MIN_POINTS = 100_000 # CSV replays this large use the optional numba kernel; below it numba's import/JIT costs more than it saves
 
 # optional csv input which allows to copy paste from Serial monitor
 parser = argparse.ArgumentParser(description="3D scan visualizer (live serial or CSV)")
@@ -18,66 +23,141 @@ parser.add_argument('--csv-file', '-c', help='Path to CSV file containing pan,ti
 args = parser.parse_args()
 CSV_FILE = args.csv_file
 
-# converts the raw `duration` value from the sensor into inches using our values from calibration.
-def get_calibrated_distance_inches(duration):
-    slope = 0.0069
-    intercept = -0.0751
-    if duration == 0:
-        return 0
-    return slope * duration + intercept
+# converts the raw `duration` value from the sensor into inches using our values from calibration:
+# distance = CALIBRATION_SLOPE * duration + CALIBRATION_INTERCEPT (inlined into the geometry below)
+# Uses the fit cached by calibration.py when present, otherwise our original values.
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.npz')
+if os.path.exists(CALIBRATION_FILE):
+    with np.load(CALIBRATION_FILE) as cal:
+        CALIBRATION_SLOPE = float(cal['slope'])
+        CALIBRATION_INTERCEPT = float(cal['intercept'])
+else:
+    CALIBRATION_SLOPE = 0.0069
+    CALIBRATION_INTERCEPT = -0.0751
+
+# sin/cos lookup tables for whole servo degrees -180..180 (index = degrees + 180).
+# Stored as plain lists so a lookup returns a Python float without numpy scalar overhead.
+_ANG = np.radians(np.arange(-180, 181))
+_SIN = np.sin(_ANG).tolist()
+_COS = np.cos(_ANG).tolist()
+
+def _angle_index(deg):
+    return min(max(int(round(deg)) + 180, 0), 360)
 
 # Converts servo measurements and durtaion to x y z position
 def compute_point_from_measurement(pan_deg, tilt_deg, duration, r1=2.0, r2=1.6):
     """
     Convert pan, tilt (degrees) and sensor duration into (x,y,z) in inches.
     Returns (x,y,z) or None if the reading is invalid / out of range.
+    Angles are rounded to whole degrees (the servos only move in whole degrees).
     """
-    r = get_calibrated_distance_inches(duration)
+    r = CALIBRATION_SLOPE * duration + CALIBRATION_INTERCEPT
     if r <= 0 or r > 30:
         return None
 
-    pan_rad = math.radians(pan_deg - 90)
-    tilt_rad = math.radians(tilt_deg)
-    # getting end effector position
-    x_ee = r1 * math.cos(pan_rad) + r2 * math.cos(tilt_rad) * math.cos(pan_rad)
-    y_ee = r1 * math.sin(pan_rad) + r2 * math.cos(tilt_rad) * math.sin(pan_rad)
-    z_ee = r2 * math.sin(tilt_rad)
+    ip = _angle_index(pan_deg - 90)
+    it = _angle_index(tilt_deg)
+    cp = _COS[ip]
+    sp = _SIN[ip]
+    ct = _COS[it]
+    st = _SIN[it]
 
-    dir_x = math.cos(tilt_rad) * math.cos(pan_rad)
-    dir_y = math.cos(tilt_rad) * math.sin(pan_rad)
-    dir_z = math.sin(tilt_rad)
-
-    x = x_ee + r * dir_x
-    y = y_ee + r * dir_y
-    z = z_ee + r * dir_z
+    # end effector (r1 + r2 along the arm) plus r along the same direction collapses to
+    # a single arm of length r2 + r on top of the r1 offset
+    k = r1 + (r2 + r) * ct
+    x = k * cp
+    y = k * sp
+    z = (r2 + r) * st
 
     return (x, y, z)
 
+# Vectorized version of compute_point_from_measurement for whole arrays of readings (CSV replay)
+def compute_points_vec(pan_deg, tilt_deg, duration, r1=2.0, r2=1.6):
+    """
+    Convert arrays of pan, tilt (degrees) and sensor durations into an (N, 3) array of (x,y,z) in inches.
+    Invalid / out of range readings are dropped, matching compute_point_from_measurement.
+    Computed in float32, which is plenty for the scanner's precision.
+    """
+    pan_deg = pan_deg.astype(np.float32, copy=False)
+    tilt_deg = tilt_deg.astype(np.float32, copy=False)
+    duration = duration.astype(np.float32, copy=False)
+    r1 = np.float32(r1)
+    r2 = np.float32(r2)
+
+    r = np.float32(CALIBRATION_SLOPE) * duration + np.float32(CALIBRATION_INTERCEPT)
+    mask = (r > 0) & (r <= 30)
+
+    pan = np.radians(pan_deg - np.float32(90))
+    tilt = np.radians(tilt_deg)
+    cp, sp = np.cos(pan), np.sin(pan)
+    ct, st = np.cos(tilt), np.sin(tilt)
+
+    k = r1 + (r2 + r) * ct
+    x = k * cp
+    y = k * sp
+    z = (r2 + r) * st
 
-def update_scatter_plot(ax, points, title='3D Scan', xlim=(0, 20), ylim=(-20, 0), zlim=(-10, 10)):
+    return np.column_stack((x, y, z))[mask]
+
+def downsample_to_pixels(xs, ys, zs):
+    """
+    Keep one point per screen pixel of the axes once there are more points than pixels,
+    since the extra markers would only overplot. Uses the current 3D view.
+    """
+    w, h = int(ax.bbox.width), int(ax.bbox.height)
+    if len(zs) <= w * h:
+        return xs, ys, zs
+    xs, ys, zs = np.asarray(xs), np.asarray(ys), np.asarray(zs)
+    px, py, _ = proj3d.proj_transform(xs, ys, zs, ax.get_proj())
+    pix = ax.transData.transform(np.column_stack((px, py)))
+    ix = np.clip(pix[:, 0] - ax.bbox.x0, 0, w - 1).astype(np.int64)
+    iy = np.clip(pix[:, 1] - ax.bbox.y0, 0, h - 1).astype(np.int64)
+    _, keep = np.unique(ix + iy * w, return_index=True)
+    return xs[keep], ys[keep], zs[keep]
+
+
+def update_scatter_plot(scat, xs, ys, zs, downsample=True):
     """
-    Clear and redraw the 3D scatter plot using points list [(x,y,z), ...].
+    Push the current coordinate arrays into the persistent scatter and redraw.
+    The axes (labels, limits, title) are configured once at setup and not touched here.
+    Only the scatter is repainted, on top of the cached background (blitting).
+    With downsample, points are thinned to one per pixel for the current view.
     """
-    if not points:
+    if len(zs) == 0:
         return
-    ax.clear()
-    x_coords, y_coords, z_coords = zip(*points)
-    ax.scatter(x_coords, y_coords, z_coords, c=z_coords, cmap='viridis', marker='.')
-    ax.set_xlabel('X (inches)')
-    ax.set_ylabel('Y (inches)')
-    ax.set_zlabel('Z (inches)')
-    ax.set_title(title)
-    ax.set_xlim(list(xlim))
-    ax.set_ylim(list(ylim))
-    ax.set_zlim(list(zlim))
-    plt.pause(0.001)
+    zmin, zmax = np.min(zs), np.max(zs)
+    if downsample:
+        xs, ys, zs = downsample_to_pixels(xs, ys, zs)
+    scat._offsets3d = (xs, ys, zs)
+    scat.set_array(np.asarray(zs))
+    scat.set_clim(zmin, zmax)
+    if background is None:
+        fig.canvas.draw()  # on_draw recaptures the background
+    fig.canvas.restore_region(background)
+    # draw_artist skips the 3D projection a full draw would do, so project the new offsets here
+    scat.do_3d_projection()
+    ax.draw_artist(scat)
+    fig.canvas.blit(fig.bbox)
+    fig.canvas.flush_events()
 
 # Connect to Arduino Serial
 ser = None
 if not CSV_FILE:
     try:
-        ser = serial.Serial(ARDUINO_COM_PORT, BAUD_RATE, timeout=5)
-        time.sleep(5)
+        # Short timeout so buffered reads hand over whatever arrived instead of waiting to fill the buffer
+        ser = serial.Serial(ARDUINO_COM_PORT, BAUD_RATE, timeout=0.1, dsrdtr=False)
+        # Toggle DTR to reset the Arduino, then wait until it starts sending rather than sleeping a fixed time
+        ser.dtr = False
+        time.sleep(0.05)
+        ser.reset_input_buffer()
+        ser.dtr = True
+        t0 = time.monotonic()
+        while not ser.in_waiting and time.monotonic() - t0 < ARDUINO_READY_TIMEOUT:
+            time.sleep(0.01)
+        if not ser.in_waiting:
+            print(f"Warning: no data from Arduino after reset (waited {ARDUINO_READY_TIMEOUT} s). Continuing anyway.")
+        # Buffered text view of the port: reads come in chunks and decoding happens in C
+        ser_text = io.TextIOWrapper(io.BufferedReader(ser, buffer_size=4096), encoding='ascii', errors='replace')
         print(f"Connected to Arduino on {ARDUINO_COM_PORT}")
     except serial.SerialException as e:
         print(f"Error: Could not open serial port {ARDUINO_COM_PORT}.")
@@ -93,101 +173,204 @@ else:
 plt.ion()
 fig = plt.figure(figsize=(12, 10))
 ax = fig.add_subplot(111, projection='3d')
+ax.set_xlabel('X (inches)')
+ax.set_ylabel('Y (inches)')
+ax.set_zlabel('Z (inches)')
+ax.set_title('Live 3D Scan (from CSV)' if CSV_FILE else 'Live 3D Scan Visualization')
+ax.set_xlim([0, 20])
+ax.set_ylim([-20, 0])
+ax.set_zlim([-10, 10])
 
-points = []
+# Created once and updated in place, so redraws don't rebuild the artist.
+# Rasterized so the points render as one image while axes/labels stay vector.
+# Animated so full canvas draws leave it out of the cached blitting background.
+scat = ax.scatter([], [], [], c=[], cmap='viridis', marker='.', rasterized=True, animated=True)
 
-# If CSV mode, load lines into memory
-csv_lines = []
-if CSV_FILE:
-    with open(CSV_FILE, newline='') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row:
+# Static background (axes, grid, labels) reused by every live update
+background = None
+
+def on_draw(event):
+    # Any full draw (resize, rotating the 3D view) changes what is behind the scatter:
+    # recapture the background, then put the animated scatter back on top
+    global background, drawn_points
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    # Also have the next live timer tick blit the points even if no new data has arrived
+    drawn_points = 0
+    if scat.get_animated():
+        scat.do_3d_projection()
+        ax.draw_artist(scat)
+
+fig.canvas.mpl_connect('draw_event', on_draw)
+fig.canvas.draw()
+
+# Point coordinates as separate preallocated arrays; only the first n_points are valid.
+# Capacity doubles when full so appends stay amortized O(1).
+capacity = 1024
+xs = np.empty(capacity, dtype=np.float32)
+ys = np.empty(capacity, dtype=np.float32)
+zs = np.empty(capacity, dtype=np.float32)
+n_points = 0
+
+def load_csv_tolerant(path):
+    """
+    Slower fallback parse of pan,tilt,duration lines that skips (and reports) lines it can't parse,
+    e.g. the truncated first or last line of a copy paste from the Serial monitor.
+    Lines are streamed straight into the result array, so only the parsed numbers are kept in memory.
+    """
+    skipped = 0
+
+    def values(f):
+        nonlocal skipped
+        for line in f:
+            if not line.strip():
                 continue
-            # Row may be single string "pan,tilt,duration" or separated fields
-            if len(row) == 1 and ',' in row[0]:
-                parts = [p.strip() for p in row[0].split(',')]
-            else:
-                parts = [p.strip() for p in row if p.strip() != '']
-            if len(parts) < 3:
+            # Quotes are dropped so rows pasted as "pan,tilt,duration" still split into fields
+            parts = line.replace('"', '').split(',')
+            try:
+                if len(parts) < 3:
+                    raise ValueError
+                pan_deg, tilt_deg, duration = float(parts[0]), float(parts[1]), float(parts[2])
+            except ValueError:
+                skipped += 1
                 continue
-            csv_lines.append(','.join(parts[:3]))
+            yield pan_deg
+            yield tilt_deg
+            yield duration
+
+    with open(path, newline='') as f:
+        rows = np.fromiter(values(f), dtype=np.float32).reshape(-1, 3)
+    if skipped:
+        print(f"Warning: Skipped {skipped} CSV line(s) that could not be parsed as pan,tilt,duration")
+    return rows
+
+# If CSV mode, parse the whole file in one C-level pass; only fall back to the tolerant parse if that fails
+if CSV_FILE:
+    try:
+        data = np.loadtxt(CSV_FILE, delimiter=',', usecols=(0, 1, 2), dtype=np.float32, ndmin=2)
+    except ValueError:
+        data = load_csv_tolerant(CSV_FILE)
+
 
+# Guards swapping the point arrays when they grow; appends publish by bumping n_points last
+points_lock = threading.Lock()
+stop_reading = threading.Event()
 
-last_data_time = time.time()
+def read_serial():
+    """
+    Reader thread: parse serial lines and append points, without ever waiting on the plot.
+    Ends when asked to stop, the port closes, or no data arrives for 10 seconds.
+    """
+    global xs, ys, zs, n_points, capacity
+    last_data_time = time.time()
+    pending = ''
+    while not stop_reading.is_set():
+        try:
+            # A read timeout can cut a line short; keep the piece until its newline arrives
+            pending += ser_text.readline()
+        except serial.SerialException:
+            break
+        line = ''
+        if pending.endswith('\n'):
+            line = pending.strip()
+            pending = ''
+            print(line)
+        if line:
+            last_data_time = time.time()  # Reset timer because we received data
+            try:
+                # Split the "pan,tilt,duration" string
+                pan_deg, tilt_deg, duration = map(float, line.split(',', 2))
+
+                pt = compute_point_from_measurement(pan_deg, tilt_deg, duration)
+                if pt is None:
+                    continue
+                x, y, z = pt
+                print(f"Object position: x={x:.2f}, y={y:.2f}, z={z:.2f}")
+                if n_points == capacity:
+                    with points_lock:
+                        capacity *= 2
+                        xs = np.resize(xs, capacity)
+                        ys = np.resize(ys, capacity)
+                        zs = np.resize(zs, capacity)
+                xs[n_points] = x
+                ys[n_points] = y
+                zs[n_points] = z
+                n_points += 1
+
+            except (ValueError, IndexError):
+                print(f"Warning: Could not parse line: '{line}'")
+
+        # If no data has been received for 10 seconds, assume the scan is done
+        if time.time() - last_data_time > 10.0:
+            print("\nNo data received for 10 seconds. Assuming scan is complete.")
+            break  # Exit the thread so the main loop can finalize and save the plot
+
+drawn_points = 0
+
+def redraw_live():
+    # GUI timer callback: redraw at a bounded rate, only when new points have arrived
+    # or a full canvas draw (see on_draw) has reset drawn_points
+    global drawn_points
+    with points_lock:
+        n = n_points
+        x, y, z = xs[:n], ys[:n], zs[:n]
+    if n != drawn_points:
+        update_scatter_plot(scat, x, y, z)
+        drawn_points = n
 
 try:
-    # If CSV mode, iterate through file lines; otherwise read from serial
+    # If CSV mode, process the whole file at once; otherwise read from serial
     if CSV_FILE:
-        for line in csv_lines:
-            if not plt.fignum_exists(fig.number):
-                break
-            time.sleep(0.001)
-            if line:
-                try:
-                    pan_deg_str, tilt_deg_str, duration_str = line.split(',')
-                    pan_deg = float(pan_deg_str)
-                    tilt_deg = float(tilt_deg_str)
-                    duration = float(duration_str)
-
-                    pt = compute_point_from_measurement(pan_deg, tilt_deg, duration)
-                    if pt is None:
-                        continue
-                    points.append(pt)
-
-                    if len(points) % 10 == 0:
-                        update_scatter_plot(ax, points, title='Live 3D Scan (from CSV)')
-
-                except (ValueError, IndexError):
-                    print(f"Warning: Could not parse CSV line: '{line}'")
-        # finished reading CSV
+        # Compute every point in one vectorized pass and draw once
+        compute_points_nb = None
+        if len(data) >= NUMBA_MIN_POINTS:
+            # Numba is optional: numpy is used without it
+            try:
+                from numba_geometry import compute_points_nb
+            except ImportError:
+                pass
+        if compute_points_nb is not None:
+            pts = np.empty((len(data), 3), dtype=np.float32)
+            valid = np.empty(len(data), dtype=np.bool_)
+            compute_points_nb(data[:, 0], data[:, 1], data[:, 2], CALIBRATION_SLOPE, CALIBRATION_INTERCEPT, pts, valid)
+            pts = pts[valid]
+        else:
+            pts = compute_points_vec(data[:, 0], data[:, 1], data[:, 2])
+        xs, ys, zs = pts[:, 0], pts[:, 1], pts[:, 2]
+        n_points = len(pts)
+        update_scatter_plot(scat, xs, ys, zs)
     else:
-        while plt.fignum_exists(fig.number):  # Loop as long as the plot window is open
-            line = ser.readline().decode('utf-8').strip()
-            print(line)
-            if line:
-                last_data_time = time.time()  # Reset timer because we received data
-                try:
-                    # Split the "pan,tilt,duration" string
-                    pan_deg_str, tilt_deg_str, duration_str = line.split(',')
-
-                    pan_deg = float(pan_deg_str)
-                    tilt_deg = float(tilt_deg_str)
-                    duration = float(duration_str)
-
-                    pt = compute_point_from_measurement(pan_deg, tilt_deg, duration)
-                    if pt is None:
-                        continue
-                    x, y, z = pt
-                    print(f"Object position: x={x:.2f}, y={y:.2f}, z={z:.2f}")
-                    points.append(pt)
-
-                    # --- Live Plot Update ---
-                    if len(points) % 10 == 0:
-                        update_scatter_plot(ax, points, title='Live 3D Scan Visualization')
-
-                except (ValueError, IndexError):
-                    print(f"Warning: Could not parse line: '{line}'")
-
-            # If no data has been received for 10 seconds, assume the scan is done
-            if time.time() - last_data_time > 10.0:
-                print("\nNo data received for 10 seconds. Assuming scan is complete.")
-                break  # Exit the loop to finalize and save the plot
+        # Serial reading runs in its own thread so plot redraws can't stall it;
+        # the plot is refreshed by a GUI timer on the main thread
+        reader = threading.Thread(target=read_serial, daemon=True)
+        reader.start()
+        timer = fig.canvas.new_timer(interval=int(REDRAW_INTERVAL * 1000))
+        timer.add_callback(redraw_live)
+        timer.start()
+        # Loop as long as the plot window is open and the scan is running
+        while reader.is_alive() and plt.fignum_exists(fig.number):
+            fig.canvas.start_event_loop(REDRAW_INTERVAL)
+        timer.stop()
 
 except KeyboardInterrupt:
     print("\nProgram stopped by user.")
 
 finally:
-     if points:
+     stop_reading.set()
+     if n_points:
          print("Generating final plot...")
          plt.ioff()
-         update_scatter_plot(ax, points, title='Final 3D Scan')
+         ax.set_title('Final 3D Scan')
+         # Back to a normal artist so full draws (savefig, show) include the points
+         scat.set_animated(False)
+         background = None
+         # Full point set, since the final plot can be rotated to any view
+         update_scatter_plot(scat, xs[:n_points], ys[:n_points], zs[:n_points], downsample=False)
 
          timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
          filename = f"3d_scan{timestamp}.png"
          
          try:
-             plt.savefig(filename, dpi=300)
+             plt.savefig(filename, dpi=150, bbox_inches='tight')
              print(f"Successfully saved plot to {filename}")
          except Exception as e:
              print(f"Error: Could not save the plot. {e}")
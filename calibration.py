@@ -1,8 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
 import numpy as np
+import argparse
 import io
+import os
+
+# Fitted slope/intercept are cached here and loaded by 3d_visualizer.py
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.npz')
+
+parser = argparse.ArgumentParser(description="Fit (or load the cached) sensor calibration and plot it")
+parser.add_argument('--refit', action='store_true', help=f'Refit the calibration even if {os.path.basename(CALIBRATION_FILE)} exists')
+args = parser.parse_args()
 
 # --- 1. Load Your Calibration Data ---
 # Create a string that acts like a file to load the data
@@ -29,23 +36,27 @@ calibration_data_string = """Actual_inch,measured_duration
 20,2930
 """
 
-# Use pandas to read the string data
-df_calibration = pd.read_csv(io.StringIO(calibration_data_string))
+# Use numpy to read the string data (columns: Actual_inch, measured_duration)
+calibration_data = np.genfromtxt(io.StringIO(calibration_data_string), delimiter=',', skip_header=1)
 
 # Extract the data columns
 # The sensor reading ('measured_duration') is our independent variable (X)
-measured_duration = df_calibration["measured_duration"].values.reshape(-1, 1)
+measured_duration = calibration_data[:, 1]
 # The actual distance is our dependent variable (y)
-actual_inch = df_calibration["Actual_inch"].values
+actual_inch = calibration_data[:, 0]
 
 # --- 2. Create the Calibration Function ---
-# Fit a linear regression model to predict actual distance from the sensor reading
-model = LinearRegression()
-model.fit(measured_duration, actual_inch)
-
-# Get the slope and intercept from the trained model
-slope = model.coef_[0]
-intercept = model.intercept_
+# The fit is deterministic, so only redo it when there is no cached result (or --refit is given)
+if not os.path.exists(CALIBRATION_FILE) or args.refit:
+    # Fit a least-squares line to predict actual distance from the sensor reading
+    slope, intercept = np.polyfit(measured_duration, actual_inch, 1)
+    np.savez(CALIBRATION_FILE, slope=slope, intercept=intercept)
+    print(f"Saved calibration to {CALIBRATION_FILE}")
+else:
+    with np.load(CALIBRATION_FILE) as cal:
+        slope = float(cal['slope'])
+        intercept = float(cal['intercept'])
+    print(f"Loaded calibration from {CALIBRATION_FILE} (use --refit to fit again)")
 
 print("--- Calibration Function ---")
 print(f"Slope: {slope:.4f} inches/unit")
@@ -54,8 +65,8 @@ print(f"Formula: Predicted_Distance_inch = {slope:.4f} * measured_duration + {in
 
 
 # --- 3. Generate the Calibration Plot ---
-# Predict the distances using the model for plotting the trendline
-predicted_inch_line = model.predict(measured_duration)
+# Predict the distances using the calibration for plotting the trendline
+predicted_inch_line = slope * measured_duration + intercept
 
 plt.figure(figsize=(10, 6))
 plt.scatter(measured_duration, actual_inch, label="Actual Data Points", color="blue")
@@ -76,19 +87,19 @@ validation_data_string = """Actual_inch,measured_duration
 5.5,790
 6.5,955
 """
-df_validation = pd.read_csv(io.StringIO(validation_data_string))
+validation_data = np.genfromtxt(io.StringIO(validation_data_string), delimiter=',', skip_header=1)
 
 # Extract the validation data
-validation_actual_inch = df_validation["Actual_inch"].values
-validation_measured_duration = df_validation["measured_duration"].values.reshape(-1, 1)
+validation_actual_inch = validation_data[:, 0]
+validation_measured_duration = validation_data[:, 1]
 
 # --- 5. Predict Distances for the Validation Data ---
-# Use the *original* model to predict distances for this new data
-validation_predicted_inch = model.predict(validation_measured_duration)
+# Use the *original* calibration to predict distances for this new data
+validation_predicted_inch = slope * validation_measured_duration + intercept
 
 print("\n--- Error Analysis ---")
-for i in range(len(validation_actual_inch)):
-    print(f"Actual: {validation_actual_inch[i]:.1f} in, Sensor Reading: {validation_measured_duration[i][0]}, Predicted: {validation_predicted_inch[i]:.2f} in")
+error_rows = np.stack((validation_actual_inch, validation_measured_duration, validation_predicted_inch), axis=1)
+print("\n".join("Actual: %.1f in, Sensor Reading: %d, Predicted: %.2f in" % tuple(row) for row in error_rows))
 
 
 # --- 6. Generate the Error Plot ---
@@ -0,0 +1,22 @@
+import math
+from numba import njit, prange
+
+# Fused single-pass version of 3d_visualizer.py's compute_points_vec for large CSV replays.
+# Kept in its own module so the visualizer only imports numba when a replay is big enough to need it.
+@njit(parallel=True, fastmath=True, cache=True)
+def compute_points_nb(pan_deg, tilt_deg, duration, slope, intercept, out, mask, r1=2.0, r2=1.6):
+    """
+    Write (x,y,z) in inches for each reading into out (N, 3) and whether it is valid into mask (N,).
+    The calibration is passed in rather than read from globals, which numba would freeze into the cache.
+    """
+    for i in prange(pan_deg.shape[0]):
+        r = slope * duration[i] + intercept
+        mask[i] = r > 0 and r <= 30
+
+        pan = math.radians(pan_deg[i] - 90)
+        tilt = math.radians(tilt_deg[i])
+        ct = math.cos(tilt)
+        k = r1 + (r2 + r) * ct
+        out[i, 0] = k * math.cos(pan)
+        out[i, 1] = k * math.sin(pan)
+        out[i, 2] = (r2 + r) * math.sin(tilt)